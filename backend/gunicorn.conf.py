@@ -0,0 +1,20 @@
+"""
+Gunicorn settings for the Document Assistant Backend API
+"""
+
+import os
+
+# Must be set before the app (and torch) is imported: one BLAS/tokenizer thread
+# per worker instead of every worker spawning one per core
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# The app imports the utils package from the project root
+pythonpath = ".."
+
+bind = "0.0.0.0:8000"
+workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Load the embedding model once in the master; forked workers share its weights copy-on-write
+preload_app = True
@@ -1,18 +1,43 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional
-import os
+from typing import List, Optional, Dict, Any, AsyncIterator, Union
+from contextlib import asynccontextmanager
+from redis.asyncio import Redis
+import numpy as np
+import aiofiles
+import asyncio
+import hashlib
 import uuid
 import json
 from datetime import datetime
 
 from utils.document_processor import DocumentProcessor
 from utils.assistant import DocumentAssistant
+from utils.session_store import SessionStore
+from utils.semantic_cache import SemanticCache
+from utils.document_cache import DocumentCache
+from utils.request_batcher import RequestBatcher
 from utils.config import settings
 
-app = FastAPI(title="Document-Aware AI Assistant", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Session metadata lives in Redis so any worker can serve any session
+    app.state.redis = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    app.state.sessions = SessionStore(app.state.redis)
+    app.state.documents = DocumentCache(app.state.redis)
+    app.state.answer_cache = SemanticCache(app.state.redis)
+    
+    # Questions arriving together are embedded in a single batch
+    app.state.query_batcher = RequestBatcher(assistant.document_processor.embed_queries)
+    app.state.query_batcher.start()
+    yield
+    await app.state.query_batcher.stop()
+    await app.state.redis.aclose()
+
+app = FastAPI(title="Document-Aware AI Assistant", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -23,12 +48,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Read size used when copying uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
 # Initialize processors
 document_processor = DocumentProcessor()
-assistant = DocumentAssistant()
-
-# In-memory storage for sessions (in production, use Redis or database)
-active_sessions = {}
+assistant = DocumentAssistant(document_processor)
 
 class QuestionRequest(BaseModel):
     session_id: str
@@ -44,6 +69,67 @@ class SessionResponse(BaseModel):
     summary: str
     status: str
 
+class ChallengeResponse(BaseModel):
+    questions: List[Dict[str, Any]]
+    instructions: str
+
+class EvaluationResponse(BaseModel):
+    score: Union[int, float]
+    feedback: str
+    correct_answer: str
+    source: str
+
+class SessionListResponse(BaseModel):
+    sessions: List[str]
+
+class MessageResponse(BaseModel):
+    message: str
+
+async def load_session(session_id: str) -> Dict[str, Any]:
+    """Fetch session metadata, loading the document into this worker if needed"""
+    session = await app.state.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    # The session may have been created by another worker (or before a restart),
+    # in which case the uploaded file is re-processed from disk
+    if not assistant.has_session(session_id):
+        file_path = settings.UPLOAD_DIR / session_id / session["filename"]
+        store = await run_in_threadpool(document_processor.process_document, file_path, session["doc_hash"])
+        assistant.initialize_session(session_id, store, session["filename"])
+    
+    # Redis holds the current challenge questions, which another worker may have regenerated
+    # since this worker loaded the document
+    if session.get("challenge_questions"):
+        assistant.set_challenge_questions(session_id, session["challenge_questions"])
+    
+    return session
+
+async def document_summary(session_id: str, doc_hash: str) -> str:
+    """Summarize the session's document, unless it has been summarized before"""
+    summary = await app.state.documents.get(doc_hash, "summary")
+    if summary is None:
+        summary = await assistant.aget_summary(session_id)
+        if not summary.startswith("Error generating summary"):
+            await app.state.documents.set(doc_hash, "summary", summary)
+    
+    return summary
+
+async def document_challenge_questions(session_id: str, doc_hash: str, refresh: bool = False) -> List[Dict[str, Any]]:
+    """Get challenge questions for the session, reusing the ones generated for this document
+    unless a new set is requested"""
+    questions = None if refresh else await app.state.documents.get(doc_hash, "challenge_questions")
+    if questions is None:
+        questions = await assistant.agen_challenges(session_id)
+    else:
+        assistant.set_challenge_questions(session_id, questions)
+    
+    # Error placeholders are not kept by the assistant, so they are not cached either
+    if assistant.get_challenge_questions(session_id) is questions:
+        await app.state.documents.set(doc_hash, "challenge_questions", questions)
+    
+    return questions
+
 @app.post("/upload", response_model=SessionResponse)
 async def upload_document(file: UploadFile = File(...)):
     """Upload and process a document (PDF or TXT)"""
@@ -53,34 +139,45 @@ async def upload_document(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
         
         # Generate session ID
-        session_id = str(uuid.uuid4())
+        session_id = uuid.uuid4().hex
         
         # Create session directory
-        session_dir = os.path.join(settings.UPLOAD_DIR, session_id)
-        os.makedirs(session_dir, exist_ok=True)
+        session_dir = settings.UPLOAD_DIR / session_id
+        session_dir.mkdir(parents=True, exist_ok=True)
         
-        # Save uploaded file
-        file_path = os.path.join(session_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Stream the uploaded file to disk without buffering it in memory,
+        # hashing it on the way to key the document cache
+        file_path = session_dir / file.filename
+        hasher = hashlib.sha256()
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                await buffer.write(chunk)
+        doc_hash = hasher.hexdigest()
         
-        # Process document
-        chunks = document_processor.process_document(file_path)
+        # Process document off the event loop (PDF parsing and embedding block);
+        # a file uploaded before is loaded from the chunk store cache instead
+        store = await run_in_threadpool(document_processor.process_document, file_path, doc_hash)
         
         # Initialize assistant with document
-        assistant.initialize_session(session_id, chunks, file.filename)
+        assistant.initialize_session(session_id, store, file.filename)
         
-        # Generate summary
-        summary = assistant.generate_summary(session_id)
+        # The summary and challenge questions are generated concurrently
+        summary, questions = await asyncio.gather(
+            document_summary(session_id, doc_hash),
+            document_challenge_questions(session_id, doc_hash)
+        )
         
         # Store session info
-        active_sessions[session_id] = {
+        await app.state.sessions.create(session_id, {
             "filename": file.filename,
             "upload_time": datetime.now().isoformat(),
-            "chunks": len(chunks),
-            "summary": summary
-        }
+            "chunks": len(store),
+            "summary": summary,
+            "doc_hash": doc_hash
+        })
+        if assistant.get_challenge_questions(session_id) is questions:
+            await app.state.sessions.update(session_id, {"challenge_questions": questions})
         
         return SessionResponse(
             session_id=session_id,
@@ -91,32 +188,61 @@ async def upload_document(file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
+def sse_event(data: Dict[str, Any]) -> str:
+    """Format a server-sent event"""
+    return f"data: {json.dumps(data)}\n\n"
+
+async def cached_answer_events(response: Dict[str, Any]) -> AsyncIterator[str]:
+    """Replay a cached answer as a single token followed by the final event"""
+    yield sse_event({"token": response["answer"]})
+    yield sse_event({"done": True, "source": response["source"], "confidence": response["confidence"]})
+
+async def answer_events(session_id: str, question: str, query_embedding: np.ndarray) -> AsyncIterator[str]:
+    """Stream the assistant's answer, caching it once generation completes"""
+    tokens = []
+    
+    # Tokens are read from the async OpenAI stream on the event loop, without a threadpool hop per token
+    async for event in assistant.astream_answer(session_id, question, query_embedding):
+        if event.get("done") and event["source"] != "Error":
+            await app.state.answer_cache.set(session_id, query_embedding, {
+                "answer": "".join(tokens).strip(),
+                "source": event["source"],
+                "confidence": event["confidence"]
+            })
+        elif "token" in event:
+            tokens.append(event["token"])
+        
+        yield sse_event(event)
+
 @app.post("/ask")
 async def ask_question(request: QuestionRequest):
-    """Handle free-form questions about the document"""
+    """Handle free-form questions about the document, streaming the answer as server-sent events"""
     try:
-        if request.session_id not in active_sessions:
-            raise HTTPException(status_code=404, detail="Session not found")
+        await load_session(request.session_id)
         
-        response = assistant.answer_question(request.session_id, request.question)
-        
-        return {
-            "answer": response["answer"],
-            "source": response["source"],
-            "confidence": response["confidence"]
-        }
+        # Rephrasings of an earlier question are answered from the cache
+        query_embedding = await app.state.query_batcher.submit(request.question)
+        cached = await app.state.answer_cache.get(request.session_id, query_embedding)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error answering question: {str(e)}")
+    
+    if cached is not None:
+        events = cached_answer_events(cached)
+    else:
+        events = answer_events(request.session_id, request.question, query_embedding)
+    
+    return StreamingResponse(events, media_type="text/event-stream")
 
-@app.post("/challenge")
-async def generate_challenge(session_id: str):
+@app.post("/challenge", response_model=ChallengeResponse)
+async def generate_challenge(session_id: str, refresh: bool = False):
     """Generate challenge questions for the user"""
     try:
-        if session_id not in active_sessions:
-            raise HTTPException(status_code=404, detail="Session not found")
+        session = await load_session(session_id)
         
-        questions = assistant.generate_challenge_questions(session_id)
+        questions = await document_challenge_questions(session_id, session["doc_hash"], refresh)
+        if assistant.get_challenge_questions(session_id) is questions:
+            await app.state.sessions.update(session_id, {"challenge_questions": questions})
         
         return {
             "questions": questions,
@@ -126,14 +252,14 @@ async def generate_challenge(session_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating challenge: {str(e)}")
 
-@app.post("/evaluate")
+@app.post("/evaluate", response_model=EvaluationResponse)
 async def evaluate_answer(request: ChallengeAnswerRequest):
     """Evaluate user's answer to a challenge question"""
     try:
-        if request.session_id not in active_sessions:
-            raise HTTPException(status_code=404, detail="Session not found")
+        await load_session(request.session_id)
         
-        evaluation = assistant.evaluate_answer(
+        evaluation = await run_in_threadpool(
+            assistant.evaluate_answer,
             request.session_id, 
             request.question_id, 
             request.answer
@@ -152,25 +278,28 @@ async def evaluate_answer(request: ChallengeAnswerRequest):
 @app.get("/session/{session_id}")
 async def get_session_info(session_id: str):
     """Get information about a session"""
-    if session_id not in active_sessions:
+    info = await app.state.sessions.get_info_json(session_id)
+    if info is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return active_sessions[session_id]
+    # Serialized once at upload time, so it is returned without re-encoding
+    return Response(content=info, media_type="application/json")
 
-@app.get("/sessions")
+@app.get("/sessions", response_model=SessionListResponse)
 async def list_sessions():
     """List all active sessions"""
-    return {"sessions": list(active_sessions.keys())}
+    return {"sessions": await app.state.sessions.list_ids()}
 
-@app.delete("/session/{session_id}")
+@app.delete("/session/{session_id}", response_model=MessageResponse)
 async def delete_session(session_id: str):
     """Delete a session and clean up resources"""
-    if session_id not in active_sessions:
+    if not await app.state.sessions.exists(session_id):
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Clean up session data
     assistant.cleanup_session(session_id)
-    del active_sessions[session_id]
+    await app.state.sessions.delete(session_id)
+    await app.state.answer_cache.clear(session_id)
     
     return {"message": "Session deleted successfully"}
 
@@ -1,8 +1,8 @@
 import streamlit as st
-import requests
+import httpx
 import json
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator
 import time
 
 # Configure page
@@ -16,8 +16,16 @@ st.set_page_config(
 # API Configuration
 API_BASE_URL = "http://localhost:8000"
 
-# Custom CSS for better UI
-st.markdown("""
+@st.cache_resource
+def get_client() -> httpx.Client:
+    """Shared HTTP client so calls reuse pooled connections to the backend"""
+    # Uploads and answers wait on LLM calls, so reads get a generous timeout
+    return httpx.Client(base_url=API_BASE_URL, timeout=httpx.Timeout(300.0, connect=5.0))
+
+@st.cache_data
+def get_custom_css() -> str:
+    """Custom CSS for better UI, built once and reused on every rerun"""
+    return """
 <style>
     .main-header {
         font-size: 3rem;
@@ -79,7 +87,7 @@ st.markdown("""
     .score-good { background: #fff3cd; color: #856404; }
     .score-fair { background: #f8d7da; color: #721c24; }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 def initialize_session_state():
     """Initialize session state variables"""
@@ -95,6 +103,8 @@ def initialize_session_state():
         st.session_state.current_question_id = 0
     if 'question_scores' not in st.session_state:
         st.session_state.question_scores = {}
+    if 'refresh_challenge' not in st.session_state:
+        st.session_state.refresh_challenge = False
     if 'conversation_history' not in st.session_state:
         st.session_state.conversation_history = []
 
@@ -102,7 +112,7 @@ def upload_document(file):
     """Upload document to backend"""
     try:
         files = {"file": (file.name, file.getvalue(), file.type)}
-        response = requests.post(f"{API_BASE_URL}/upload", files=files)
+        response = get_client().post("/upload", files=files)
         
         if response.status_code == 200:
             return response.json()
@@ -113,25 +123,36 @@ def upload_document(file):
         st.error(f"Error uploading document: {str(e)}")
         return None
 
-def ask_question(session_id: str, question: str):
-    """Ask a question to the assistant"""
+def ask_question(session_id: str, question: str, result: Dict[str, Any]) -> Iterator[str]:
+    """Ask a question to the assistant, yielding answer tokens as they stream in.
+    
+    The source and confidence from the final event are stored in result.
+    """
     try:
         payload = {"session_id": session_id, "question": question}
-        response = requests.post(f"{API_BASE_URL}/ask", json=payload)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Question failed: {response.text}")
-            return None
+        with get_client().stream("POST", "/ask", json=payload) as response:
+            if response.status_code != 200:
+                response.read()
+                st.error(f"Question failed: {response.text}")
+                return
+            
+            for line in response.iter_lines():
+                if not line.startswith("data: "):
+                    continue
+                
+                event = json.loads(line[len("data: "):])
+                if event.get("done"):
+                    result.update(event)
+                else:
+                    yield event["token"]
     except Exception as e:
         st.error(f"Error asking question: {str(e)}")
-        return None
 
-def generate_challenge(session_id: str):
+def generate_challenge(session_id: str, refresh: bool = False):
     """Generate challenge questions"""
     try:
-        response = requests.post(f"{API_BASE_URL}/challenge", params={"session_id": session_id})
+        params = {"session_id": session_id, "refresh": refresh}
+        response = get_client().post("/challenge", params=params)
         
         if response.status_code == 200:
             return response.json()
@@ -146,7 +167,7 @@ def evaluate_answer(session_id: str, question_id: int, answer: str):
     """Evaluate user's answer"""
     try:
         payload = {"session_id": session_id, "question_id": question_id, "answer": answer}
-        response = requests.post(f"{API_BASE_URL}/evaluate", json=payload)
+        response = get_client().post("/evaluate", json=payload)
         
         if response.status_code == 200:
             return response.json()
@@ -175,11 +196,10 @@ def display_score(score: int):
     </div>
     """, unsafe_allow_html=True)
 
-def render_home_page():
-    """Render the home page"""
-    st.markdown('<h1 class="main-header">📄 Document-Aware AI Assistant</h1>', unsafe_allow_html=True)
-    
-    st.markdown("""
+@st.cache_data
+def get_feature_card_html() -> str:
+    """Static feature overview shown on the home page"""
+    return """
     <div class="feature-card">
         <h3>🎯 What can this assistant do?</h3>
         <ul>
@@ -190,7 +210,26 @@ def render_home_page():
             <li><strong>Grounded Responses:</strong> All answers backed by document references</li>
         </ul>
     </div>
-    """, unsafe_allow_html=True)
+    """
+
+def get_conversation_turn_html(conv: Dict[str, Any]) -> str:
+    """Render one question and answer as a single line of HTML.
+    
+    Turns are joined into one markdown element, where a newline or indent inside the HTML
+    would end the block and render the rest of the history as a code block.
+    """
+    answer = conv["answer"].replace("\n", "<br>")
+    return (
+        f'<div class="question-box"><strong>Q:</strong> {conv["question"]}</div>'
+        f'<div class="answer-box"><strong>A:</strong> {answer}<br>'
+        f'<small><strong>Source:</strong> {conv["source"]} | <strong>Confidence:</strong> {conv["confidence"]:.2f}</small></div>'
+    )
+
+def render_home_page():
+    """Render the home page"""
+    st.markdown('<h1 class="main-header">📄 Document-Aware AI Assistant</h1>', unsafe_allow_html=True)
+    
+    st.markdown(get_feature_card_html(), unsafe_allow_html=True)
     
     st.markdown("### 📁 Upload Your Document")
     st.markdown("Choose a PDF or TXT file to get started:")
@@ -262,36 +301,32 @@ def render_ask_anything():
     
     if st.button("🔍 Ask", type="primary", disabled=not question):
         if question:
-            with st.spinner("Searching document and generating answer..."):
-                response = ask_question(st.session_state.session_id, question)
+            # Render the answer as it is generated
+            response = {}
+            answer = st.write_stream(ask_question(st.session_state.session_id, question, response))
+            
+            if response:
+                # Add to conversation history
+                st.session_state.conversation_history.append({
+                    "question": question,
+                    "answer": answer,
+                    "source": response["source"],
+                    "confidence": response["confidence"]
+                })
                 
-                if response:
-                    # Add to conversation history
-                    st.session_state.conversation_history.append({
-                        "question": question,
-                        "answer": response["answer"],
-                        "source": response["source"],
-                        "confidence": response["confidence"]
-                    })
-                    
-                    # Clear input
-                    st.session_state.question_input = ""
-                    st.rerun()
+                # Clear input
+                st.session_state.question_input = ""
+                st.rerun()
     
     # Display conversation history
     if st.session_state.conversation_history:
         st.markdown("### 📜 Conversation History")
         
-        for i, conv in enumerate(reversed(st.session_state.conversation_history)):
-            st.markdown(f"""
-            <div class="question-box">
-                <strong>Q:</strong> {conv['question']}
-            </div>
-            <div class="answer-box">
-                <strong>A:</strong> {conv['answer']}<br>
-                <small><strong>Source:</strong> {conv['source']} | <strong>Confidence:</strong> {conv['confidence']:.2f}</small>
-            </div>
-            """, unsafe_allow_html=True)
+        # Render the whole history as one element rather than one per turn
+        history_html = "\n".join(
+            get_conversation_turn_html(conv) for conv in reversed(st.session_state.conversation_history)
+        )
+        st.markdown(history_html, unsafe_allow_html=True)
 
 def render_challenge_mode():
     """Render the Challenge Mode interface"""
@@ -302,11 +337,15 @@ def render_challenge_mode():
     if st.session_state.challenge_questions is None:
         if st.button("🎲 Generate Challenge Questions", type="primary"):
             with st.spinner("Generating challenging questions..."):
-                result = generate_challenge(st.session_state.session_id)
+                result = generate_challenge(
+                    st.session_state.session_id,
+                    refresh=st.session_state.refresh_challenge
+                )
                 
                 if result:
                     st.session_state.challenge_questions = result["questions"]
                     st.session_state.current_question_id = 0
+                    st.session_state.refresh_challenge = False
                     st.rerun()
     
     # Display challenge questions
@@ -373,10 +412,12 @@ def render_challenge_mode():
             if st.button("🎲 Generate New Challenge", type="secondary"):
                 st.session_state.challenge_questions = None
                 st.session_state.question_scores = {}
+                st.session_state.refresh_challenge = True
                 st.rerun()
 
 def main():
     """Main application"""
+    st.markdown(get_custom_css(), unsafe_allow_html=True)
     initialize_session_state()
     
     # Check if document is uploaded
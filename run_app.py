@@ -6,33 +6,71 @@ Document-Aware AI Assistant Application Launcher
 import os
 import sys
 import subprocess
-import threading
 import time
 import signal
+import socket
+from importlib.metadata import PackageNotFoundError, distribution
 from pathlib import Path
 
-def run_backend():
-    """Run the FastAPI backend"""
+# uvloop is not available on Windows
+EVENT_LOOP = "asyncio" if sys.platform == "win32" else "uvloop"
+
+def run_backend(dev: bool = False) -> subprocess.Popen:
+    """Start the FastAPI backend in a child process"""
     print("🚀 Starting FastAPI backend...")
-    os.chdir(Path(__file__).parent / "backend")
+    base_path = Path(__file__).parent
     
-    # Add parent directory to Python path
-    sys.path.insert(0, str(Path(__file__).parent))
+    # The backend imports the utils package from the project root
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(base_path), env.get("PYTHONPATH")]))
+    
+    if dev:
+        # Auto-reload requires a single worker
+        command = [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "0.0.0.0", "--port", "8000",
+            "--loop", EVENT_LOOP, "--http", "httptools",
+            "--reload"
+        ]
+    elif sys.platform == "win32":
+        # gunicorn does not run on Windows; uvicorn's own workers are spawned rather than
+        # forked, so each loads its own copy of the embedding model
+        env.setdefault("OMP_NUM_THREADS", "1")
+        env.setdefault("TOKENIZERS_PARALLELISM", "false")
+        command = [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "0.0.0.0", "--port", "8000",
+            "--loop", EVENT_LOOP, "--http", "httptools",
+            "--workers", os.getenv("WEB_CONCURRENCY", str(os.cpu_count()))
+        ]
+    else:
+        # Workers, preloading and thread limits come from backend/gunicorn.conf.py
+        command = [sys.executable, "-m", "gunicorn", "main:app"]
+    
+    return subprocess.Popen(command, cwd=base_path / "backend", env=env)
+
+def wait_for_backend(backend: subprocess.Popen, timeout: float = 300) -> bool:
+    """Wait until the backend accepts connections, returning False if it exits first"""
+    deadline = time.monotonic() + timeout
+    
+    while time.monotonic() < deadline:
+        if backend.poll() is not None:
+            print(f"❌ Backend exited during startup (exit code {backend.returncode})")
+            return False
+        
+        try:
+            with socket.create_connection(("127.0.0.1", 8000), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.5)
     
-    try:
-        import uvicorn
-        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
-    except Exception as e:
-        print(f"❌ Error starting backend: {e}")
-        sys.exit(1)
+    print("⚠️  Backend is still starting; launching the frontend anyway")
+    return True
 
 def run_frontend():
     """Run the Streamlit frontend"""
     print("🎨 Starting Streamlit frontend...")
     
-    # Wait for backend to start
-    time.sleep(3)
-    
     frontend_path = Path(__file__).parent / "frontend" / "streamlit_app.py"
     
     try:
@@ -51,16 +89,18 @@ def check_dependencies():
     print("🔍 Checking dependencies...")
     
     required_packages = [
-        "fastapi", "uvicorn", "streamlit", "PyPDF2", "openai", 
+        "fastapi", "uvicorn", "streamlit", "pypdfium2", "openai", 
         "sentence-transformers", "tiktoken", "python-dotenv"
     ]
     
     missing_packages = []
     
+    # Look packages up in the installed metadata rather than importing them,
+    # which for sentence-transformers would load torch
     for package in required_packages:
         try:
-            __import__(package.replace("-", "_"))
-        except ImportError:
+            distribution(package)
+        except PackageNotFoundError:
             missing_packages.append(package)
     
     if missing_packages:
@@ -139,10 +179,15 @@ def main():
     print("🔄 Press Ctrl+C to stop the application")
     print("-" * 60)
     
+    backend = None
+    
     try:
-        # Start backend in a separate thread
-        backend_thread = threading.Thread(target=run_backend, daemon=True)
-        backend_thread.start()
+        # Start backend in a child process
+        backend = run_backend(dev="--dev" in sys.argv)
+        
+        # Don't start the frontend against a backend that failed to start
+        if not wait_for_backend(backend):
+            sys.exit(1)
         
         # Start frontend in main thread
         run_frontend()
@@ -152,6 +197,9 @@ def main():
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
     finally:
+        if backend is not None:
+            backend.terminate()
+            backend.wait()
         print("👋 Goodbye!")
 
 if __name__ == "__main__":
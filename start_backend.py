@@ -4,32 +4,25 @@ Start the Document Assistant Backend API Server
 """
 
 import sys
-import os
-from pathlib import Path
 
-# Add the document_assistant directory to Python path
-sys.path.insert(0, str(Path(__file__).parent))
-
-# Change to backend directory
-os.chdir(Path(__file__).parent / "backend")
+from run_app import run_backend
 
 if __name__ == "__main__":
+    backend = None
+    
     try:
-        import uvicorn
-        print("🚀 Starting Document Assistant Backend API...")
         print("📚 API will be available at: http://localhost:8000")
         print("📖 API documentation: http://localhost:8000/docs")
         print("🔄 Press Ctrl+C to stop the server")
         
-        uvicorn.run(
-            "main:app",
-            host="0.0.0.0",
-            port=8000,
-            reload=True,
-            log_level="info"
-        )
+        # --dev runs a single auto-reloading worker
+        backend = run_backend(dev="--dev" in sys.argv)
+        sys.exit(backend.wait())
     except KeyboardInterrupt:
+        # The server received the same Ctrl+C, so wait for it to shut down
+        if backend is not None:
+            backend.wait()
         print("\n🛑 Backend server stopped")
     except Exception as e:
         print(f"❌ Error starting backend: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -1,269 +1,228 @@
 import json
 import re
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
-from .document_processor import DocumentProcessor, DocumentChunk
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+import numpy as np
+from cachetools import TTLCache
+from openai import OpenAI, AsyncOpenAI
+from .document_processor import DocumentProcessor, DocumentChunk, ChunkStore, ChunkIndex
+from .chunk_batcher import ChunkBatcher
 from .config import settings
 
+# System prompts hold only fixed instructions, so every request starts with the same bytes
+# and OpenAI can reuse its cached prefix. Variable content goes in the user message.
+SUMMARY_SYSTEM_PROMPT = f"""You summarize documents.
+Provide a concise summary of the document in the user message in {settings.SUMMARY_MAX_WORDS} words or fewer.
+Focus on the main topics, key findings, and important conclusions."""
+
+ANSWER_SYSTEM_PROMPT = """You answer questions about a document using excerpts from it.
+The user message contains document excerpts followed by a question.
+
+Instructions:
+1. Answer based ONLY on the information provided in the document excerpts
+2. If the answer cannot be found in the excerpts, say "I cannot find this information in the provided document"
+3. Include a brief justification explaining which part of the document supports your answer
+4. Be specific and accurate"""
+
+CHALLENGE_SYSTEM_PROMPT = f"""You write questions that test comprehension and logical reasoning.
+Based on the document content in the user message, create exactly {settings.CHALLENGE_QUESTIONS_COUNT} challenging questions.
+
+Requirements for each question:
+1. Require deep understanding, not just surface-level reading
+2. Test logical reasoning, inference, or analysis
+3. Have clear, specific answers that can be found in the document
+4. Be challenging but fair
+5. Include questions that test cause-and-effect, comparison, or implication
+
+Number the questions from 1, and explain each expected answer with a reference to the document."""
+
+EVALUATION_SYSTEM_PROMPT = """Evaluate the user's answer to a question based on the document content.
+The user message contains the document context, the question, the expected answer, and the user's answer.
+
+Instructions:
+1. Score the answer from 0-100 based on accuracy and completeness
+2. Consider partial credit for partially correct answers
+3. Provide constructive feedback
+4. Reference specific parts of the document that support the correct answer"""
+
+# Structured output schemas, so the API only returns JSON of the expected shape.
+# Strict mode requires an object at the root and every property to be listed as required.
+CHALLENGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "question": {"type": "string"},
+                    "expected_answer": {"type": "string"},
+                    "explanation": {"type": "string"}
+                },
+                "required": ["id", "question", "expected_answer", "explanation"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["questions"],
+    "additionalProperties": False
+}
+
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer"},
+        "feedback": {"type": "string"},
+        "correct_answer": {"type": "string"},
+        "document_reference": {"type": "string"}
+    },
+    "required": ["score", "feedback", "correct_answer", "document_reference"],
+    "additionalProperties": False
+}
+
 class DocumentAssistant:
     """Main assistant class that handles all AI interactions"""
     
-    def __init__(self):
+    # Trade-off between relevance and diversity when selecting challenge chunks
+    MMR_LAMBDA = 0.5
+    
+    def __init__(self, document_processor: Optional[DocumentProcessor] = None):
         self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.document_processor = DocumentProcessor()
-        self.sessions = {}  # Store session data
-        
-    def initialize_session(self, session_id: str, chunks: List[DocumentChunk], filename: str):
+        self.aclient = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        # Share the caller's processor so the embedding model is only loaded once
+        self.document_processor = document_processor or DocumentProcessor()
+        self.chunk_batcher = ChunkBatcher()
+        
+        # Loaded documents, bounded in count and age. An evicted session is reloaded from
+        # its uploaded file by the backend, so eviction only costs re-processing.
+        # TTLCache is not thread-safe and is used from the threadpool, hence the lock.
+        self.sessions = TTLCache(maxsize=settings.SESSION_CACHE_SIZE, ttl=settings.SESSION_TTL)
+        self._sessions_lock = threading.Lock()
+        
+    def initialize_session(self, session_id: str, store: ChunkStore, filename: str):
         """Initialize a new session with document chunks"""
-        self.sessions[session_id] = {
-            "chunks": chunks,
+        session = {
+            "chunks": store.chunks,
+            "index": ChunkIndex(store),
             "filename": filename,
             "challenge_questions": None,
             "conversation_history": []
         }
+        with self._sessions_lock:
+            self.sessions[session_id] = session
     
-    def generate_summary(self, session_id: str) -> str:
-        """Generate a concise summary of the document (≤ 150 words)"""
-        if session_id not in self.sessions:
-            raise ValueError("Session not found")
-        
-        chunks = self.sessions[session_id]["chunks"]
-        
-        # Get representative chunks (first few and some from middle/end)
-        summary_chunks = []
-        total_chunks = len(chunks)
-        
-        if total_chunks <= 5:
-            summary_chunks = chunks
-        else:
-            # Take first 2, middle 2, and last 2
-            summary_chunks.extend(chunks[:2])
-            mid_start = total_chunks // 2 - 1
-            summary_chunks.extend(chunks[mid_start:mid_start + 2])
-            summary_chunks.extend(chunks[-2:])
-        
-        # Combine chunks for summary
-        combined_text = "\n\n".join([chunk.content for chunk in summary_chunks])
-        
-        prompt = f"""
-        Please provide a concise summary of this document in exactly {settings.SUMMARY_MAX_WORDS} words or fewer.
-        Focus on the main topics, key findings, and important conclusions.
-        
-        Document content:
-        {combined_text}
-        
-        Summary (≤ {settings.SUMMARY_MAX_WORDS} words):
-        """
+    def has_session(self, session_id: str) -> bool:
+        """Check whether a session's document is loaded"""
+        with self._sessions_lock:
+            return session_id in self.sessions
+    
+    def get_challenge_questions(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the challenge questions kept for a session, if any"""
+        return self._get_session(session_id)["challenge_questions"]
+    
+    def set_challenge_questions(self, session_id: str, questions: List[Dict[str, Any]]):
+        """Use previously generated challenge questions for a session"""
+        self._get_session(session_id)["challenge_questions"] = questions
+    
+    async def aget_summary(self, session_id: str) -> str:
+        """Generate the document summary without blocking, so it can run alongside other requests"""
+        request = self._summary_request(session_id)
         
         try:
-            response = self.client.chat.completions.create(
-                model=settings.MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=settings.SUMMARY_TEMPERATURE,
-                max_tokens=200
-            )
-            
-            summary = response.choices[0].message.content.strip()
-            
-            # Ensure word count
-            words = summary.split()
-            if len(words) > settings.SUMMARY_MAX_WORDS:
-                summary = " ".join(words[:settings.SUMMARY_MAX_WORDS]) + "..."
-            
-            return summary
+            response = await self.aclient.chat.completions.create(**request)
+            return self._limit_summary(response.choices[0].message.content)
             
         except Exception as e:
             return f"Error generating summary: {str(e)}"
     
-    def answer_question(self, session_id: str, question: str) -> Dict[str, Any]:
-        """Answer a free-form question about the document"""
-        if session_id not in self.sessions:
-            raise ValueError("Session not found")
-        
-        chunks = self.sessions[session_id]["chunks"]
-        
-        # Find relevant chunks
-        relevant_chunks = self.document_processor.find_relevant_chunks(chunks, question, top_k=3)
-        
-        # Prepare context
-        context = "\n\n".join([f"Chunk {i+1}:\n{chunk.content}" for i, chunk in enumerate(relevant_chunks)])
-        
-        prompt = f"""
-        Based on the following document excerpts, please answer the question accurately and concisely.
-        
-        Document excerpts:
-        {context}
-        
-        Question: {question}
-        
-        Instructions:
-        1. Answer based ONLY on the information provided in the document excerpts
-        2. If the answer cannot be found in the excerpts, say "I cannot find this information in the provided document"
-        3. Include a brief justification explaining which part of the document supports your answer
-        4. Be specific and accurate
-        
-        Answer:
-        """
-        
+    async def astream_answer(self, session_id: str, question: str,
+                             query_embedding: Optional[np.ndarray] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Answer a free-form question, yielding {"token": ...} events as the answer is
+        generated and a final {"done": True, "source": ..., "confidence": ...} event"""
+        stream = None
+        
+        # Failures are reported as events: by the time this runs the response has started.
+        # That includes the session being evicted since the request was accepted.
         try:
-            response = self.client.chat.completions.create(
-                model=settings.MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=settings.QA_TEMPERATURE,
-                max_tokens=settings.MAX_TOKENS
-            )
+            relevant_chunks, prompt = self._prepare_answer(session_id, question, query_embedding)
+            stream = await self.aclient.chat.completions.create(**self._answer_request(session_id, prompt))
             
-            answer = response.choices[0].message.content.strip()
+            tokens = []
+            async for chunk in stream:
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if token:
+                    tokens.append(token)
+                    yield {"token": token}
             
-            # Store in conversation history
-            self.sessions[session_id]["conversation_history"].append({
-                "question": question,
-                "answer": answer,
-                "relevant_chunks": [chunk.to_dict() for chunk in relevant_chunks]
-            })
-            
-            return {
-                "answer": answer,
-                "source": f"Based on {len(relevant_chunks)} relevant sections from the document",
-                "confidence": self._calculate_confidence(relevant_chunks, question)
-            }
+            answer = "".join(tokens).strip()
             
         except Exception as e:
-            return {
-                "answer": f"Error answering question: {str(e)}",
-                "source": "Error",
-                "confidence": 0.0
-            }
+            yield {"token": f"Error answering question: {str(e)}"}
+            yield {"done": True, "source": "Error", "confidence": 0.0}
+            return
+        finally:
+            # Also runs when the client disconnects and the generator is closed mid-stream,
+            # so the connection to OpenAI is released rather than left open
+            if stream is not None:
+                await stream.close()
+        
+        yield {"done": True, **self._record_answer(session_id, question, answer, relevant_chunks)}
     
-    def generate_challenge_questions(self, session_id: str) -> List[Dict[str, Any]]:
-        """Generate logic-based challenge questions"""
-        if session_id not in self.sessions:
-            raise ValueError("Session not found")
-        
-        chunks = self.sessions[session_id]["chunks"]
-        
-        # Select diverse chunks for question generation
-        selected_chunks = self._select_diverse_chunks(chunks, 5)
-        combined_text = "\n\n".join([chunk.content for chunk in selected_chunks])
-        
-        prompt = f"""
-        Based on the following document, create exactly {settings.CHALLENGE_QUESTIONS_COUNT} challenging questions that test comprehension and logical reasoning.
-        
-        Document content:
-        {combined_text}
-        
-        Requirements for each question:
-        1. Require deep understanding, not just surface-level reading
-        2. Test logical reasoning, inference, or analysis
-        3. Have clear, specific answers that can be found in the document
-        4. Be challenging but fair
-        5. Include questions that test cause-and-effect, comparison, or implication
-        
-        Format your response as a JSON array with this structure:
-        [
-          {{
-            "id": 1,
-            "question": "Your question here",
-            "expected_answer": "The correct answer",
-            "explanation": "Why this is the correct answer with document reference"
-          }}
-        ]
-        
-        Questions:
-        """
+    async def agen_challenges(self, session_id: str) -> List[Dict[str, Any]]:
+        """Generate challenge questions without blocking, so they can run alongside other requests"""
+        request = self._challenge_request(session_id)
         
         try:
-            response = self.client.chat.completions.create(
-                model=settings.MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=settings.CHALLENGE_TEMPERATURE,
-                max_tokens=settings.MAX_TOKENS
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-            # Parse JSON response
-            questions = json.loads(content)
+            response = await self.aclient.chat.completions.create(**request)
+            return self._store_challenge_questions(session_id, response.choices[0].message.content)
             
-            # Store challenge questions in session
-            self.sessions[session_id]["challenge_questions"] = questions
-            
-            return questions
-            
-        except json.JSONDecodeError:
-            # Fallback: generate questions manually
-            return self._generate_fallback_questions(combined_text)
         except Exception as e:
             return [{"id": 1, "question": f"Error generating questions: {str(e)}", "expected_answer": "Error", "explanation": "Error"}]
     
     def evaluate_answer(self, session_id: str, question_id: int, user_answer: str) -> Dict[str, Any]:
         """Evaluate user's answer to a challenge question"""
-        if session_id not in self.sessions:
-            raise ValueError("Session not found")
+        session = self._get_session(session_id)
         
-        challenge_questions = self.sessions[session_id]["challenge_questions"]
+        challenge_questions = session["challenge_questions"]
         if not challenge_questions or question_id > len(challenge_questions):
             raise ValueError("Invalid question ID")
         
         question_data = challenge_questions[question_id - 1]
-        chunks = self.sessions[session_id]["chunks"]
         
         # Find relevant chunks for this question
-        relevant_chunks = self.document_processor.find_relevant_chunks(chunks, question_data["question"], top_k=3)
-        context = "\n\n".join([chunk.content for chunk in relevant_chunks])
+        relevant_chunks = self.document_processor.find_relevant_chunks(
+            session["index"], question_data["question"], top_k=3
+        )
+        context = "\n\n".join([chunk.content for chunk in self._in_document_order(relevant_chunks)])
         
-        prompt = f"""
-        Evaluate the user's answer to the following question based on the document content.
-        
-        Document context:
-        {context}
-        
-        Question: {question_data["question"]}
-        Expected answer: {question_data["expected_answer"]}
-        User's answer: {user_answer}
-        
-        Instructions:
-        1. Score the answer from 0-100 based on accuracy and completeness
-        2. Consider partial credit for partially correct answers
-        3. Provide constructive feedback
-        4. Reference specific parts of the document that support the correct answer
-        
-        Respond in JSON format:
-        {{
-          "score": 85,
-          "feedback": "Your detailed feedback here",
-          "correct_answer": "The complete correct answer",
-          "document_reference": "Which part of the document supports this"
-        }}
-        
-        Evaluation:
-        """
+        prompt = f"""Document context:
+{context}
+
+Question: {question_data["question"]}
+Expected answer: {question_data["expected_answer"]}
+User's answer: {user_answer}"""
         
         try:
             response = self.client.chat.completions.create(
                 model=settings.MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
+                messages=self._messages(EVALUATION_SYSTEM_PROMPT, prompt),
                 temperature=0.1,
-                max_tokens=settings.MAX_TOKENS
+                max_tokens=settings.MAX_TOKENS,
+                response_format=self._json_schema_format("answer_evaluation", EVALUATION_SCHEMA),
+                extra_body=self._prompt_cache_options(session_id)
             )
             
-            content = response.choices[0].message.content.strip()
-            evaluation = json.loads(content)
+            evaluation = json.loads(response.choices[0].message.content)
             
             return {
-                "score": evaluation.get("score", 0),
-                "feedback": evaluation.get("feedback", "No feedback available"),
-                "correct_answer": evaluation.get("correct_answer", question_data["expected_answer"]),
-                "source": evaluation.get("document_reference", "Document reference not available")
+                "score": evaluation["score"],
+                "feedback": evaluation["feedback"],
+                "correct_answer": evaluation["correct_answer"],
+                "source": evaluation["document_reference"]
             }
             
-        except json.JSONDecodeError:
-            return {
-                "score": 0,
-                "feedback": "Error evaluating answer",
-                "correct_answer": question_data["expected_answer"],
-                "source": "Error processing evaluation"
-            }
         except Exception as e:
             return {
                 "score": 0,
@@ -272,10 +231,170 @@ class DocumentAssistant:
                 "source": "Error"
             }
     
+    def _prepare_answer(self, session_id: str, question: str,
+                        query_embedding: Optional[np.ndarray]) -> Tuple[List[DocumentChunk], str]:
+        """Retrieve the chunks relevant to a question and build the answer prompt"""
+        session = self._get_session(session_id)
+        
+        # Find relevant chunks
+        relevant_chunks = self.document_processor.find_relevant_chunks(
+            session["index"], question, top_k=3, query_embedding=query_embedding
+        )
+        
+        # Prepare context in document order, so turns retrieving the same chunks send the same prefix
+        context = "\n\n".join([
+            f"Chunk {i+1}:\n{chunk.content}" for i, chunk in enumerate(self._in_document_order(relevant_chunks))
+        ])
+        
+        prompt = f"""Document excerpts:
+{context}
+
+Question: {question}"""
+        
+        return relevant_chunks, prompt
+    
+    def _answer_request(self, session_id: str, prompt: str) -> Dict[str, Any]:
+        """Build the streaming completion request for an answer prompt"""
+        return {
+            "model": settings.MODEL_NAME,
+            "messages": self._messages(ANSWER_SYSTEM_PROMPT, prompt),
+            "temperature": settings.QA_TEMPERATURE,
+            "max_tokens": settings.MAX_TOKENS,
+            "stream": True,
+            "extra_body": self._prompt_cache_options(session_id)
+        }
+    
+    def _record_answer(self, session_id: str, question: str, answer: str,
+                       relevant_chunks: List[DocumentChunk]) -> Dict[str, Any]:
+        """Store an answer in the conversation history and return its source and confidence"""
+        self._get_session(session_id)["conversation_history"].append({
+            "question": question,
+            "answer": answer,
+            "relevant_chunks": [chunk.to_dict() for chunk in relevant_chunks]
+        })
+        
+        return {
+            "source": f"Based on {len(relevant_chunks)} relevant sections from the document",
+            "confidence": self._calculate_confidence(relevant_chunks, question)
+        }
+    
+    def _messages(self, system_prompt: str, user_content: str) -> List[Dict[str, str]]:
+        """Build a chat request with the fixed instructions first and the variable content last"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+    
+    def _json_schema_format(self, name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+        """Response format that constrains the completion to JSON matching the schema"""
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+    
+    def _prompt_cache_options(self, session_id: str) -> Dict[str, Any]:
+        """Route a session's requests together so they land on the same prompt cache"""
+        return {"prompt_cache_key": session_id}
+    
+    def _in_document_order(self, chunks: List[DocumentChunk]) -> List[DocumentChunk]:
+        """Order retrieved chunks by their position in the document rather than by relevance"""
+        return sorted(chunks, key=lambda chunk: chunk.idx)
+    
+    def _summary_request(self, session_id: str) -> Dict[str, Any]:
+        """Build the completion request for the document summary"""
+        chunks = self._get_session(session_id)["chunks"]
+        
+        # Take the first and last chunks, then ever finer evenly spaced ones from the middle,
+        # until the token budget is spent. The selection depends only on the document, so
+        # repeated requests send the same prompt.
+        summary_chunks = []
+        budget = settings.SUMMARY_CONTEXT_TOKENS
+        for i in self._spread_order(len(chunks)):
+            if summary_chunks and chunks[i].token_count > budget:
+                break
+            summary_chunks.append(chunks[i])
+            budget -= chunks[i].token_count
+        
+        summary_chunks = self._in_document_order(summary_chunks)
+        
+        return {
+            "model": settings.MODEL_NAME,
+            "messages": self._messages(SUMMARY_SYSTEM_PROMPT, self._document_prompt(summary_chunks)),
+            "temperature": settings.SUMMARY_TEMPERATURE,
+            "max_tokens": 200,
+            "extra_body": self._prompt_cache_options(session_id)
+        }
+    
+    def _spread_order(self, count: int) -> List[int]:
+        """Order positions 0..count-1 as first, last, then midpoints of ever smaller intervals,
+        so that any prefix of the order is spread evenly over the document"""
+        if count <= 2:
+            return list(range(count))
+        
+        order = [0, count - 1]
+        intervals = deque([(0, count - 1)])
+        while intervals:
+            start, stop = intervals.popleft()
+            if stop - start < 2:
+                continue
+            middle = (start + stop) // 2
+            order.append(middle)
+            intervals.append((start, middle))
+            intervals.append((middle, stop))
+        
+        return order
+    
+    def _limit_summary(self, summary: str) -> str:
+        """Truncate a generated summary to the configured word count"""
+        summary = summary.strip()
+        
+        words = summary.split()
+        if len(words) > settings.SUMMARY_MAX_WORDS:
+            summary = " ".join(words[:settings.SUMMARY_MAX_WORDS]) + "..."
+        
+        return summary
+    
+    def _challenge_request(self, session_id: str) -> Dict[str, Any]:
+        """Build the completion request for challenge questions"""
+        index = self._get_session(session_id)["index"]
+        
+        # Select diverse chunks for question generation, as many as fit in a single request
+        selected_chunks = self._select_diverse_chunks(index, 5)
+        selected_chunks = self.chunk_batcher.batch_chunks(
+            selected_chunks, CHALLENGE_SYSTEM_PROMPT + self._document_prompt([])
+        )[0]
+        
+        return {
+            "model": settings.MODEL_NAME,
+            "messages": self._messages(CHALLENGE_SYSTEM_PROMPT, self._document_prompt(selected_chunks)),
+            "temperature": settings.CHALLENGE_TEMPERATURE,
+            "max_tokens": settings.MAX_TOKENS,
+            "response_format": self._json_schema_format("challenge_questions", CHALLENGE_SCHEMA),
+            "extra_body": self._prompt_cache_options(session_id)
+        }
+    
+    def _store_challenge_questions(self, session_id: str, content: str) -> List[Dict[str, Any]]:
+        """Parse generated challenge questions and keep them in the session"""
+        questions = json.loads(content)["questions"]
+        self._get_session(session_id)["challenge_questions"] = questions
+        return questions
+    
+    def _document_prompt(self, chunks: List[DocumentChunk]) -> str:
+        """User message holding document content, shared by the summary and challenge requests"""
+        combined_text = "\n\n".join([chunk.content for chunk in chunks])
+        return f"Document content:\n{combined_text}"
+    
     def cleanup_session(self, session_id: str):
         """Clean up session data"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        with self._sessions_lock:
+            self.sessions.pop(session_id, None)
+    
+    def _get_session(self, session_id: str) -> Dict[str, Any]:
+        """Return a loaded session, raising ValueError if it is not loaded"""
+        with self._sessions_lock:
+            session = self.sessions.get(session_id)
+        
+        if session is None:
+            raise ValueError("Session not found")
+        
+        return session
     
     def _calculate_confidence(self, chunks: List[DocumentChunk], question: str) -> float:
         """Calculate confidence score based on chunk relevance"""
@@ -292,41 +411,27 @@ class DocumentAssistant:
         
         return base_confidence * length_factor
     
-    def _select_diverse_chunks(self, chunks: List[DocumentChunk], count: int) -> List[DocumentChunk]:
-        """Select diverse chunks from the document"""
+    def _select_diverse_chunks(self, index: ChunkIndex, count: int) -> List[DocumentChunk]:
+        """Select representative but mutually dissimilar chunks by maximal marginal relevance"""
+        chunks = index.chunks
         if len(chunks) <= count:
             return chunks
         
-        # Select chunks from different parts of the document
-        selected = []
-        step = len(chunks) // count
-        
-        for i in range(count):
-            index = i * step
-            if index < len(chunks):
-                selected.append(chunks[index])
-        
-        return selected
-    
-    def _generate_fallback_questions(self, text: str) -> List[Dict[str, Any]]:
-        """Generate fallback questions if JSON parsing fails"""
-        return [
-            {
-                "id": 1,
-                "question": "What is the main topic discussed in this document?",
-                "expected_answer": "Please refer to the document content",
-                "explanation": "This question tests basic comprehension of the document's main theme"
-            },
-            {
-                "id": 2,
-                "question": "What are the key findings or conclusions mentioned?",
-                "expected_answer": "Please refer to the document content",
-                "explanation": "This question tests understanding of important results or conclusions"
-            },
-            {
-                "id": 3,
-                "question": "How do the different sections of the document relate to each other?",
-                "expected_answer": "Please refer to the document content",
-                "explanation": "This question tests logical reasoning and document structure understanding"
-            }
-        ]
\ No newline at end of file
+        # Embeddings are L2-normalized, so inner products are cosine similarities. Relevance
+        # is similarity to the document centroid, rescaled to unit length so it is on the same
+        # scale as redundancy: the highest similarity to any chunk already selected, updated
+        # with one matrix-vector product per pick.
+        matrix = index.matrix
+        centroid = matrix.mean(axis=0)
+        centroid /= max(np.linalg.norm(centroid), 1e-12)
+        relevance = matrix @ centroid
+        redundancy = np.full(len(chunks), -np.inf, dtype=np.float32)
+        
+        selected = [int(np.argmax(relevance))]
+        for _ in range(count - 1):
+            np.maximum(redundancy, matrix @ matrix[selected[-1]], out=redundancy)
+            scores = self.MMR_LAMBDA * relevance - (1 - self.MMR_LAMBDA) * redundancy
+            scores[selected] = -np.inf
+            selected.append(int(np.argmax(scores)))
+        
+        return self._in_document_order([chunks[i] for i in selected])
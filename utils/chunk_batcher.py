@@ -0,0 +1,47 @@
+from typing import List
+import tiktoken
+from .document_processor import DocumentChunk
+from .config import settings
+
+class ChunkBatcher:
+    """Greedily packs document chunks into batches that fit the model context window"""
+
+    def __init__(self, context_limit: int = settings.CONTEXT_LIMIT, response_buffer: int = 500):
+        self.context_limit = context_limit
+        self.response_buffer = response_buffer
+
+        try:
+            self.tokenizer = tiktoken.encoding_for_model(settings.MODEL_NAME)
+        except KeyError:
+            self.tokenizer = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text))
+
+    def batch_chunks(self, chunks: List[DocumentChunk], prompt: str = "") -> List[List[DocumentChunk]]:
+        """Split chunks, in order, into batches that each fit in one request with the prompt.
+        
+        There is always at least one batch, which is empty if there are no chunks.
+        """
+        budget = self.context_limit - self.response_buffer - self.count_tokens(prompt)
+
+        batches = []
+        current_batch = []
+        current_tokens = 0
+
+        for chunk in chunks:
+            chunk_tokens = self.count_tokens(chunk.content)
+
+            # A chunk larger than the budget still gets a batch of its own
+            if current_batch and current_tokens + chunk_tokens > budget:
+                batches.append(current_batch)
+                current_batch = []
+                current_tokens = 0
+
+            current_batch.append(chunk)
+            current_tokens += chunk_tokens
+
+        if current_batch or not batches:
+            batches.append(current_batch)
+
+        return batches
@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .config import settings
+
+class ChunkStoreCache:
+    """On-disk cache of processed documents, keyed by file hash and shared by all workers.
+
+    Each document is stored as an .npy embedding matrix, memory-mapped when loaded, and a
+    JSON sidecar holding its chunks. The sidecar is written last, so it marks a complete entry.
+    """
+
+    def __init__(self, processing_version: str, path: Path = settings.VECTOR_DB_PATH / "documents"):
+        self.processing_version = processing_version
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def key(self, file_hash: str) -> str:
+        """Cache key for a file processed with this cache's model and chunking settings"""
+        return hashlib.sha256(f"{self.processing_version}\0{file_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """Return the chunk records and read-only embedding matrix stored under a key, if any"""
+        try:
+            with open(self.path / f"{key}.json", "r", encoding="utf-8") as file:
+                records = json.load(file)
+            embeddings = np.load(self.path / f"{key}.npy", mmap_mode="r")
+        except FileNotFoundError:
+            return None
+
+        return records, embeddings
+
+    def set(self, key: str, records: List[Dict[str, Any]], embeddings: np.ndarray):
+        """Store a document's chunk records and float32 embedding matrix under a key"""
+        # Written under temporary names and renamed, so other workers never read a partial file
+        suffix = f".{uuid.uuid4().hex}.tmp"
+
+        matrix_tmp = self.path / f"{key}.npy{suffix}"
+        with open(matrix_tmp, "wb") as file:
+            np.save(file, np.asarray(embeddings, dtype=np.float32))
+        os.replace(matrix_tmp, self.path / f"{key}.npy")
+
+        records_tmp = self.path / f"{key}.json{suffix}"
+        with open(records_tmp, "w", encoding="utf-8") as file:
+            json.dump(records, file, ensure_ascii=False)
+        os.replace(records_tmp, self.path / f"{key}.json")
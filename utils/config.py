@@ -1,20 +1,53 @@
 import os
+import platform
 from pathlib import Path
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+def default_onnx_file() -> str:
+    """Pick the int8 ONNX export of the embedding model built for this CPU"""
+    machine = platform.machine().lower()
+    if machine in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    
+    # CPU flags are only read on Linux; elsewhere the AVX2 export runs on any recent x86 CPU
+    try:
+        with open("/proc/cpuinfo", "r") as file:
+            flags = next((line.split() for line in file if line.startswith("flags")), [])
+    except OSError:
+        flags = []
+    
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    if "avx512f" in flags:
+        return "onnx/model_qint8_avx512.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
 class Settings:
     # API Configuration
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
-    MODEL_NAME: str = os.getenv("MODEL_NAME", "gpt-3.5-turbo")
+    MODEL_NAME: str = os.getenv("MODEL_NAME", "gpt-4o-mini")
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
     
+    # Kept on CPU by default: CUDA cannot be initialized before gunicorn forks its workers
+    EMBEDDING_DEVICE: str = os.getenv("EMBEDDING_DEVICE", "cpu")
+    
+    # "onnx" runs an int8-quantized export of the embedding model on ONNX Runtime,
+    # falling back to "torch" (FP32 PyTorch) if it cannot be loaded. Unless set, the
+    # export is chosen for this CPU (arm64, AVX-512 VNNI, AVX-512 or AVX2)
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "onnx")
+    EMBEDDING_ONNX_FILE: str = os.getenv("EMBEDDING_ONNX_FILE") or default_onnx_file()
+    
     # Document Processing
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
     MAX_TOKENS: int = int(os.getenv("MAX_TOKENS", "2000"))
+    CONTEXT_LIMIT: int = int(os.getenv("CONTEXT_LIMIT", "8000"))
+    
+    # Processes used to extract text from long PDFs
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", "4"))
     
     # File Storage
     BASE_DIR: Path = Path(__file__).parent.parent
@@ -24,8 +57,23 @@ class Settings:
     # Vector Database
     VECTOR_DB_PATH: Path = DATA_DIR / "vector_db"
     
+    # Session Storage
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    SESSION_TTL: int = int(os.getenv("SESSION_TTL", "3600"))
+    
+    # Documents each worker keeps loaded in memory; older sessions are reloaded on demand
+    SESSION_CACHE_SIZE: int = int(os.getenv("SESSION_CACHE_SIZE", "256"))
+    DOCUMENT_CACHE_TTL: int = int(os.getenv("DOCUMENT_CACHE_TTL", "604800"))
+    
+    # Minimum cosine similarity for a question to reuse a cached answer, and how many
+    # recent questions each session keeps
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_SIZE: int = int(os.getenv("SEMANTIC_CACHE_SIZE", "64"))
+    
     # Assistant Configuration
     SUMMARY_MAX_WORDS: int = int(os.getenv("SUMMARY_MAX_WORDS", "150"))
+    # Document tokens sent when summarizing, spread across the document; keep below CONTEXT_LIMIT
+    SUMMARY_CONTEXT_TOKENS: int = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "3000"))
     CHALLENGE_QUESTIONS_COUNT: int = int(os.getenv("CHALLENGE_QUESTIONS_COUNT", "3"))
     
     # Temperature settings for different tasks
@@ -0,0 +1,29 @@
+import json
+from typing import Any, Optional
+from redis.asyncio import Redis
+from .config import settings
+
+class DocumentCache:
+    """Redis cache for LLM outputs that depend only on the document content"""
+
+    KEY_PREFIX = "doc:"
+
+    def __init__(self, redis: Redis, ttl: int = settings.DOCUMENT_CACHE_TTL):
+        self.redis = redis
+        self.ttl = ttl
+
+    def _key(self, doc_hash: str) -> str:
+        return f"{self.KEY_PREFIX}{doc_hash}"
+
+    async def get(self, doc_hash: str, field: str) -> Optional[Any]:
+        """Return a cached value for the document, or None on a miss"""
+        value = await self.redis.hget(self._key(doc_hash), field)
+        return None if value is None else json.loads(value)
+
+    async def set(self, doc_hash: str, field: str, value: Any):
+        """Cache a value for the document and refresh its expiry"""
+        key = self._key(doc_hash)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, field, json.dumps(value))
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
@@ -1,21 +1,47 @@
 import os
 import re
-from typing import List, Dict
+import hashlib
+import threading
+import unicodedata
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Tuple
 from pathlib import Path
-import PyPDF2
 import tiktoken
 from sentence_transformers import SentenceTransformer
 import numpy as np
+import faiss
 from .config import settings
+from .embedding_cache import EmbeddingCache
+from .chunk_store_cache import ChunkStoreCache
+from .pdf_extract import count_pages, extract_pages
+
+# Patterns used by DocumentProcessor._clean_text, compiled once
+_RE_SPECIAL_CHARS = re.compile(r'[^\w\s\.\!\?\,\;\:\-\(\)]')
+_RE_SPACES = re.compile(r'[^\S\n]+')
+_RE_LINE_EDGES = re.compile(r' ?\n ?')
+_RE_BLANK_LINES = re.compile(r'\n{3,}')
+
+# The same special characters as a translate() table, for text that is pure ASCII
+_ASCII_SPECIAL_CHARS = {
+    code: None for code in range(128) if _RE_SPECIAL_CHARS.match(chr(code))
+}
 
 class DocumentChunk:
     """Represents a chunk of text from a document"""
-    def __init__(self, content: str, page_number: int = None, start_pos: int = None, end_pos: int = None):
+    def __init__(self, content: str, page_number: int = None, start_pos: int = None, end_pos: int = None,
+                 idx: int = None, token_count: int = None):
         self.content = content
         self.page_number = page_number
         self.start_pos = start_pos
         self.end_pos = end_pos
-        self.embedding = None
+        
+        # Position in the document's chunk list, which is also the chunk's row in the embedding matrix
+        self.idx = idx
+        
+        # Tokens in the chunk, counted while chunking so prompts can be budgeted without re-encoding
+        self.token_count = token_count
         
     def to_dict(self):
         return {
@@ -25,15 +51,144 @@ class DocumentChunk:
             "end_pos": self.end_pos
         }
 
+class ChunkStore:
+    """The chunks of one document, with their embeddings as the rows of one contiguous matrix"""
+    
+    def __init__(self, chunks: List[DocumentChunk], embeddings: np.ndarray):
+        self.chunks = chunks
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def __len__(self):
+        return len(self.chunks)
+
+class ChunkIndex:
+    """Similarity search over the chunks of one document.
+    
+    Chunk embeddings are expected to be L2-normalized, so inner products are cosine
+    similarities. Candidates are scanned in an 8-bit scalar-quantized FAISS index, a
+    quarter of the size of the FP32 embeddings, then reranked exactly against the FP32 matrix.
+    """
+    
+    RERANK_CANDIDATES = 64
+    
+    def __init__(self, store: ChunkStore):
+        self.chunks = store.chunks
+        self.matrix = store.embeddings
+        self.quantized = None
+        
+        if not self.chunks:
+            return
+        
+        # Small documents are reranked in full, so only larger ones need the quantized scan
+        if len(self.chunks) > self.RERANK_CANDIDATES:
+            self.quantized = faiss.IndexScalarQuantizer(
+                self.matrix.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+            self.quantized.train(self.matrix)
+            self.quantized.add(self.matrix)
+    
+    def search(self, query_embedding: np.ndarray, top_k: int) -> List[DocumentChunk]:
+        """Return the top k chunks by cosine similarity, most similar first"""
+        if not self.chunks:
+            return []
+        
+        # The query's norm scales every score equally, so it does not need normalizing
+        query = np.asarray(query_embedding, dtype=np.float32)
+        
+        # Exact cosine similarity for the candidates only; when every chunk is a
+        # candidate the matrix is used in place rather than gathered into a copy
+        if self.quantized is None:
+            candidates = np.arange(len(self.chunks))
+            scores = self.matrix @ query
+        else:
+            _, ids = self.quantized.search(query.reshape(1, -1), self.RERANK_CANDIDATES)
+            candidates = ids[0][ids[0] >= 0]
+            scores = self.matrix[candidates] @ query
+        
+        # Partition out the top k, then sort only those
+        top_k = min(top_k, len(candidates))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [self.chunks[i] for i in candidates[top]]
+
 class DocumentProcessor:
     """Handles document processing, chunking, and vectorization"""
     
+    EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+    
+    # Pages per extraction task when a PDF is split across worker processes
+    PDF_PAGES_PER_TASK = 16
+    
+    # Version of the extraction, cleaning and chunking output. Bump it whenever that code
+    # changes, so documents saved in the chunk store cache are processed again.
+    PROCESSING_VERSION = 1
+    
     def __init__(self):
         self.tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_model, embedding_variant = self._load_embedding_model()
+        
+        # Quantized and FP32 embeddings differ slightly, so each variant has its own cache entries
+        self.embedding_cache = EmbeddingCache(f"{self.EMBEDDING_MODEL_NAME}:{embedding_variant}")
+        
+        # Processed documents depend on the processing code and chunking settings as well as the embedding model
+        self.chunk_store_cache = ChunkStoreCache(
+            f"v{self.PROCESSING_VERSION}:{self.EMBEDDING_MODEL_NAME}:{embedding_variant}:"
+            f"{settings.CHUNK_SIZE}:{settings.CHUNK_OVERLAP}"
+        )
+        
+        # Started on first use, so forked server workers never inherit it
+        self._pdf_pool = None
+        self._pdf_pool_lock = threading.Lock()
+        
+    def _load_embedding_model(self) -> Tuple[SentenceTransformer, str]:
+        """Load the int8 ONNX Runtime embedding model, falling back to the PyTorch FP32 model.
+        
+        Returns the model and a name for the variant that was loaded.
+        """
+        if settings.EMBEDDING_BACKEND == "onnx":
+            try:
+                import onnxruntime
+                
+                # A session created before gunicorn forks must not own a thread pool, which
+                # the forked workers would not inherit; follow the OMP_NUM_THREADS it sets
+                session_options = onnxruntime.SessionOptions()
+                if os.getenv("OMP_NUM_THREADS"):
+                    session_options.intra_op_num_threads = int(os.environ["OMP_NUM_THREADS"])
+                
+                model = SentenceTransformer(
+                    self.EMBEDDING_MODEL_NAME,
+                    device=settings.EMBEDDING_DEVICE,
+                    backend="onnx",
+                    model_kwargs={
+                        "file_name": settings.EMBEDDING_ONNX_FILE,
+                        "session_options": session_options,
+                        # Fail if the file is missing, rather than silently exporting an FP32 model
+                        "export": False
+                    }
+                )
+                return model, f"onnx:{settings.EMBEDDING_ONNX_FILE}"
+            except Exception as e:
+                print(f"Warning: could not load the ONNX embedding model ({e}). Falling back to PyTorch.")
+        
+        model = SentenceTransformer(self.EMBEDDING_MODEL_NAME, device=settings.EMBEDDING_DEVICE)
+        return model, "torch"
+    
+    def process_document(self, file_path: str, file_hash: str = None) -> ChunkStore:
+        """Process a document and return its chunks and their embeddings.
+        
+        A file processed before is loaded from the chunk store cache, with its embeddings
+        memory-mapped. file_hash is the file's SHA-256, computed here if not given.
+        """
+        if file_hash is None:
+            file_hash = self._hash_file(file_path)
+        cache_key = self.chunk_store_cache.key(file_hash)
+        
+        cached = self.chunk_store_cache.get(cache_key)
+        if cached is not None:
+            records, embeddings = cached
+            chunks = [DocumentChunk(**record, idx=i) for i, record in enumerate(records)]
+            return ChunkStore(chunks, embeddings)
         
-    def process_document(self, file_path: str) -> List[DocumentChunk]:
-        """Process a document and return chunks"""
         file_extension = Path(file_path).suffix.lower()
         
         if file_extension == '.pdf':
@@ -50,24 +205,80 @@ class DocumentProcessor:
         chunks = self._create_chunks(text)
         
         # Generate embeddings
-        self._generate_embeddings(chunks)
+        store = ChunkStore(chunks, self._generate_embeddings(chunks))
         
-        return chunks
+        self.chunk_store_cache.set(
+            cache_key,
+            [{**chunk.to_dict(), "token_count": chunk.token_count} for chunk in chunks],
+            store.embeddings
+        )
+        return store
+    
+    def _hash_file(self, file_path: str) -> str:
+        """Return the SHA-256 of a file, read in blocks"""
+        hasher = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            while block := file.read(1 << 20):
+                hasher.update(block)
+        return hasher.hexdigest()
     
     def _extract_text_from_pdf(self, file_path: str) -> str:
         """Extract text from PDF file"""
-        text = ""
+        file_path = str(file_path)
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num, page in enumerate(pdf_reader.pages):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"\n--- Page {page_num + 1} ---\n{page_text}"
+            page_count = count_pages(file_path)
+            page_ranges = [
+                (start, min(start + self.PDF_PAGES_PER_TASK, page_count))
+                for start in range(0, page_count, self.PDF_PAGES_PER_TASK)
+            ]
+            
+            # Pages are independent, so longer documents are extracted in parallel processes
+            if len(page_ranges) > 1 and settings.PDF_WORKERS > 1:
+                page_texts = self._extract_pages_in_pool(file_path, page_ranges)
+            else:
+                page_texts = extract_pages(file_path, 0, page_count)
         except Exception as e:
             raise Exception(f"Error reading PDF: {str(e)}")
         
-        return text
+        return "".join(
+            f"\n\n--- Page {page_num + 1} ---\n{page_text}"
+            for page_num, page_text in enumerate(page_texts) if page_text
+        )
+    
+    def _extract_pages_in_pool(self, file_path: str, page_ranges: List[Tuple[int, int]]) -> List[str]:
+        """Extract page ranges in the process pool, in page order.
+        
+        A pool whose worker died (out of memory, or a crash in pdfium) cannot be used again,
+        so it is replaced and the extraction retried once in a fresh pool.
+        """
+        for attempt in range(2):
+            pool = self._get_pdf_pool()
+            try:
+                futures = [pool.submit(extract_pages, file_path, start, stop) for start, stop in page_ranges]
+                return [text for future in futures for text in future.result()]
+            except BrokenProcessPool:
+                self._discard_pdf_pool(pool)
+                if attempt:
+                    raise
+    
+    def _get_pdf_pool(self) -> ProcessPoolExecutor:
+        """Return the process pool used for PDF extraction, starting it if needed"""
+        with self._pdf_pool_lock:
+            if self._pdf_pool is None:
+                # Spawned rather than forked: this process holds torch and its threads
+                self._pdf_pool = ProcessPoolExecutor(
+                    max_workers=settings.PDF_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pdf_pool
+    
+    def _discard_pdf_pool(self, pool: ProcessPoolExecutor):
+        """Shut down a broken pool so the next extraction starts a new one"""
+        with self._pdf_pool_lock:
+            # Another thread may already have replaced it
+            if self._pdf_pool is pool:
+                self._pdf_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
     
     def _extract_text_from_txt(self, file_path: str) -> str:
         """Extract text from TXT file"""
@@ -81,14 +292,23 @@ class DocumentProcessor:
     
     def _clean_text(self, text: str) -> str:
         """Clean and preprocess text"""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
+        # Compose accented characters, so the same text always has the same bytes
+        # and combining marks are not stripped as special characters below
+        text = unicodedata.normalize("NFC", text)
+        
+        # Remove special characters but keep basic punctuation. translate() is about twice
+        # as fast as the regex on ASCII text, but much slower once any other character appears
+        if text.isascii():
+            text = text.translate(_ASCII_SPECIAL_CHARS)
+        else:
+            text = _RE_SPECIAL_CHARS.sub('', text)
         
-        # Remove special characters but keep basic punctuation
-        text = re.sub(r'[^\w\s\.\!\?\,\;\:\-\(\)]', '', text)
+        # Remove excessive whitespace, keeping line breaks so paragraphs can still be split
+        text = _RE_SPACES.sub(' ', text)
+        text = _RE_LINE_EDGES.sub('\n', text)
         
         # Remove excessive line breaks
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        text = _RE_BLANK_LINES.sub('\n\n', text)
         
         return text.strip()
     
@@ -96,82 +316,109 @@ class DocumentProcessor:
         """Split text into chunks with overlap"""
         chunks = []
         
-        # Split by paragraphs first
+        # Split by paragraphs first, tokenizing them all in one batch
         paragraphs = text.split('\n\n')
+        paragraph_tokens = self.tokenizer.encode_batch(paragraphs)
+        separator_tokens = self.tokenizer.encode('\n\n')
         
-        current_chunk = ""
-        current_tokens = 0
+        # The current chunk is kept as token ids, so it never has to be re-encoded;
+        # its text is decoded once when the chunk is finalized
+        current_tokens = []
         start_pos = 0
+        end_pos = 0
+        paragraph_start = 0
         
-        for paragraph in paragraphs:
-            paragraph_tokens = len(self.tokenizer.encode(paragraph))
-            
+        for paragraph, tokens in zip(paragraphs, paragraph_tokens):
             # If adding this paragraph would exceed chunk size, finalize current chunk
-            if current_tokens + paragraph_tokens > settings.CHUNK_SIZE and current_chunk:
+            if current_tokens and len(current_tokens) + len(tokens) > settings.CHUNK_SIZE:
                 chunks.append(DocumentChunk(
-                    content=current_chunk.strip(),
+                    content=self.tokenizer.decode(current_tokens).strip(),
                     start_pos=start_pos,
-                    end_pos=start_pos + len(current_chunk)
+                    end_pos=end_pos,
+                    idx=len(chunks),
+                    token_count=len(current_tokens)
                 ))
                 
-                # Start new chunk with overlap
-                overlap_text = self._get_overlap_text(current_chunk, settings.CHUNK_OVERLAP)
-                current_chunk = overlap_text + " " + paragraph
-                current_tokens = len(self.tokenizer.encode(current_chunk))
-                start_pos = start_pos + len(current_chunk) - len(overlap_text)
+                # Start new chunk with overlap sliced from the end of the previous one
+                current_tokens = current_tokens[max(0, len(current_tokens) - settings.CHUNK_OVERLAP):]
+                start_pos = end_pos - len(self.tokenizer.decode(current_tokens))
+            
+            # Add paragraph to current chunk
+            if current_tokens:
+                current_tokens += separator_tokens
             else:
-                # Add paragraph to current chunk
-                if current_chunk:
-                    current_chunk += "\n\n" + paragraph
-                else:
-                    current_chunk = paragraph
-                current_tokens += paragraph_tokens
+                start_pos = paragraph_start
+            current_tokens += tokens
+            end_pos = paragraph_start + len(paragraph)
+            paragraph_start = end_pos + 2
         
         # Add the last chunk
-        if current_chunk:
+        if current_tokens:
             chunks.append(DocumentChunk(
-                content=current_chunk.strip(),
+                content=self.tokenizer.decode(current_tokens).strip(),
                 start_pos=start_pos,
-                end_pos=start_pos + len(current_chunk)
+                end_pos=end_pos,
+                idx=len(chunks),
+                token_count=len(current_tokens)
             ))
         
         return chunks
     
-    def _get_overlap_text(self, text: str, overlap_tokens: int) -> str:
-        """Get overlap text from the end of a chunk"""
-        tokens = self.tokenizer.encode(text)
-        if len(tokens) <= overlap_tokens:
-            return text
+    def embed_chunks(self, chunks: List[DocumentChunk], batch_size: int = 64) -> np.ndarray:
+        """Embed all chunks in batched forward passes, returning an (n, dim) float32 array of unit vectors"""
+        texts = [chunk.content for chunk in chunks]
         
-        overlap_tokens_list = tokens[-overlap_tokens:]
-        return self.tokenizer.decode(overlap_tokens_list)
+        # encode() sorts texts by length before padding each batch and restores the input order
+        embeddings = self.embedding_model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return embeddings.astype(np.float32, copy=False)
     
-    def _generate_embeddings(self, chunks: List[DocumentChunk]):
-        """Generate embeddings for all chunks"""
-        texts = [chunk.content for chunk in chunks]
-        embeddings = self.embedding_model.encode(texts)
+    def _generate_embeddings(self, chunks: List[DocumentChunk]) -> np.ndarray:
+        """Generate the (n, dim) embedding matrix for all chunks, encoding only those not
+        already in the embedding cache"""
+        keys = [self.embedding_cache.key(chunk.content) for chunk in chunks]
+        cached = self.embedding_cache.get_many(keys)
         
-        for chunk, embedding in zip(chunks, embeddings):
-            chunk.embedding = embedding
+        # Repeated chunks within the document are encoded once
+        misses = {key: chunk for key, chunk in zip(keys, chunks) if key not in cached}
+        if misses:
+            embeddings = self.embed_chunks(list(misses.values()))
+            encoded = dict(zip(misses, embeddings))
+            self.embedding_cache.set_many(encoded)
+            cached.update(encoded)
+        
+        if not chunks:
+            return np.empty((0, self.embedding_model.get_sentence_embedding_dimension()), dtype=np.float32)
+        
+        return np.stack([cached[key] for key in keys])
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Generate the embedding for a single query"""
+        return self.embedding_model.encode([query], normalize_embeddings=True)[0]
     
-    def find_relevant_chunks(self, chunks: List[DocumentChunk], query: str, top_k: int = 5) -> List[DocumentChunk]:
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Generate embeddings for several queries in one forward pass"""
+        return self.embedding_model.encode(
+            queries, batch_size=len(queries), normalize_embeddings=True, show_progress_bar=False
+        )
+    
+    def find_relevant_chunks(self, index: ChunkIndex, query: str, top_k: int = 5,
+                             query_embedding: np.ndarray = None) -> List[DocumentChunk]:
         """Find most relevant chunks for a query"""
-        query_embedding = self.embedding_model.encode([query])
-        
-        similarities = []
-        for chunk in chunks:
-            similarity = np.dot(query_embedding[0], chunk.embedding) / (
-                np.linalg.norm(query_embedding[0]) * np.linalg.norm(chunk.embedding)
-            )
-            similarities.append((chunk, similarity))
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
         
-        # Sort by similarity and return top k
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return [chunk for chunk, _ in similarities[:top_k]]
+        return index.search(query_embedding, top_k)
     
     def get_chunk_context(self, chunks: List[DocumentChunk], target_chunk: DocumentChunk, context_size: int = 2) -> str:
         """Get surrounding context for a chunk"""
-        target_index = chunks.index(target_chunk)
+        # The chunk's position is stored on it, so the list is not searched
+        target_index = target_chunk.idx
         
         start_index = max(0, target_index - context_size)
         end_index = min(len(chunks), target_index + context_size + 1)
@@ -0,0 +1,64 @@
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from .config import settings
+
+class EmbeddingCache:
+    """On-disk cache of chunk embeddings keyed by content hash, shared by all sessions and workers"""
+
+    # SQLite caps the number of bound parameters per statement
+    MAX_VARIABLES = 500
+
+    def __init__(self, model_name: str, path: Path = settings.VECTOR_DB_PATH / "emb_cache.sqlite"):
+        self.model_name = model_name
+        self.path = path
+
+        with self._connect() as conn:
+            # WAL lets readers in other workers proceed while one worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection for one transaction.
+        
+        A connection per call, since connections cannot be shared across threads or forked workers.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def key(self, text: str) -> str:
+        """Cache key for a text embedded with this cache's model"""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return the cached embeddings for whichever keys are present"""
+        found = {}
+        with self._connect() as conn:
+            for start in range(0, len(keys), self.MAX_VARIABLES):
+                batch = keys[start:start + self.MAX_VARIABLES]
+                rows = conn.execute(
+                    f"SELECT key, embedding FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        return found
+
+    def set_many(self, items: Dict[str, np.ndarray]):
+        """Store float32 embeddings under their keys"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, embedding) VALUES (?, ?)",
+                [(key, np.asarray(embedding, dtype=np.float32).tobytes()) for key, embedding in items.items()]
+            )
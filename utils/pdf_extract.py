@@ -0,0 +1,31 @@
+"""
+PDF page extraction, kept free of heavy imports so that spawned worker processes
+start without loading torch or the embedding model
+"""
+
+from typing import List
+import pypdfium2 as pdfium
+
+def count_pages(file_path: str) -> int:
+    """Return the number of pages in a PDF"""
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def extract_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of a PDF, in page order"""
+    pdf = pdfium.PdfDocument(file_path)
+    texts = []
+    try:
+        for page_index in range(start, stop):
+            page = pdf[page_index]
+            text_page = page.get_textpage()
+            texts.append(text_page.get_text_range())
+            text_page.close()
+            page.close()
+    finally:
+        pdf.close()
+
+    return texts
@@ -0,0 +1,72 @@
+import base64
+import json
+from typing import Any, Dict, Optional
+import numpy as np
+from redis.asyncio import Redis
+from .config import settings
+
+class SemanticCache:
+    """Per-session answer cache for near-duplicate questions.
+
+    Each session keeps its most recent questions as a bounded ring buffer of embeddings,
+    with the answers in a parallel list, so a lookup is one exact scan of a small matrix.
+    """
+
+    KEY_PREFIX = "qcache:"
+
+    def __init__(self, redis: Redis, max_entries: int = settings.SEMANTIC_CACHE_SIZE,
+                 threshold: float = settings.SEMANTIC_CACHE_THRESHOLD, ttl: int = settings.SESSION_TTL):
+        self.redis = redis
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+
+    def _keys(self, session_id: str):
+        prefix = f"{self.KEY_PREFIX}{session_id}"
+        return f"{prefix}:embeddings", f"{prefix}:responses"
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    async def get(self, session_id: str, embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Return the cached response for the most similar earlier question, if close enough"""
+        embeddings_key, responses_key = self._keys(session_id)
+
+        # Read both lists in one transaction so a concurrent insert cannot misalign them
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrange(embeddings_key, 0, -1)
+            pipe.lrange(responses_key, 0, -1)
+            encoded, responses = await pipe.execute()
+
+        if not encoded or len(encoded) != len(responses):
+            return None
+
+        # Embeddings are stored as base64 float32 since the client decodes replies as text
+        matrix = np.frombuffer(b"".join(base64.b64decode(e) for e in encoded), dtype=np.float32)
+        similarities = matrix.reshape(len(encoded), -1) @ self._normalize(embedding)
+        best = int(np.argmax(similarities))
+
+        if similarities[best] < self.threshold:
+            return None
+
+        return json.loads(responses[best])
+
+    async def set(self, session_id: str, embedding: np.ndarray, response: Dict[str, Any]):
+        """Cache a response under the question embedding, evicting the oldest beyond the limit"""
+        embeddings_key, responses_key = self._keys(session_id)
+        encoded = base64.b64encode(self._normalize(embedding).tobytes()).decode("ascii")
+
+        # One transaction keeps the two lists aligned
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lpush(embeddings_key, encoded)
+            pipe.lpush(responses_key, json.dumps(response))
+            for key in (embeddings_key, responses_key):
+                pipe.ltrim(key, 0, self.max_entries - 1)
+                pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def clear(self, session_id: str):
+        """Drop every cached answer for a session"""
+        await self.redis.delete(*self._keys(session_id))
@@ -0,0 +1,98 @@
+import json
+import time
+from typing import Any, Dict, List, Optional
+from redis.asyncio import Redis
+from redis.exceptions import WatchError
+from .config import settings
+
+class SessionStore:
+    """Redis-backed session metadata shared by all backend workers"""
+
+    KEY_PREFIX = "sess:"
+
+    # Sorted set of session ids scored by expiry time, so listing avoids a keyspace scan
+    INDEX_KEY = "sessions:index"
+
+    # Hash field holding the session info pre-serialized for GET /session/{id}
+    INFO_FIELD = "_info"
+
+    def __init__(self, redis: Redis, ttl: int = settings.SESSION_TTL):
+        self.redis = redis
+        self.ttl = ttl
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}{session_id}"
+
+    async def create(self, session_id: str, data: Dict[str, Any]):
+        """Store session metadata as a hash that expires after the session TTL"""
+        key = self._key(session_id)
+
+        # Values are JSON-encoded so ints and nested data survive the round trip
+        mapping = {field: json.dumps(value) for field, value in data.items()}
+        mapping[self.INFO_FIELD] = json.dumps(data)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, self.ttl)
+            pipe.zadd(self.INDEX_KEY, {session_id: time.time() + self.ttl})
+            await pipe.execute()
+
+    async def update(self, session_id: str, data: Dict[str, Any]) -> bool:
+        """Set fields on an existing session without changing its expiry.
+        
+        Returns False, writing nothing, if the session has expired or been deleted, so a
+        late update cannot recreate it as a partial hash with no TTL.
+        """
+        key = self._key(session_id)
+        mapping = {field: json.dumps(value) for field, value in data.items()}
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # The write is discarded if the key changes or expires after the check
+                    await pipe.watch(key)
+                    if not await pipe.exists(key):
+                        return False
+
+                    pipe.multi()
+                    pipe.hset(key, mapping=mapping)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    async def exists(self, session_id: str) -> bool:
+        """Check whether a session is still active"""
+        return bool(await self.redis.exists(self._key(session_id)))
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the session metadata, or None if it has expired or never existed"""
+        data = await self.redis.hgetall(self._key(session_id))
+        if not data:
+            return None
+
+        data.pop(self.INFO_FIELD, None)
+        return {field: json.loads(value) for field, value in data.items()}
+
+    async def get_info_json(self, session_id: str) -> Optional[str]:
+        """Return the metadata the session was created with, already serialized as JSON"""
+        return await self.redis.hget(self._key(session_id), self.INFO_FIELD)
+
+    async def delete(self, session_id: str) -> bool:
+        """Delete a session, returning whether it existed"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._key(session_id))
+            pipe.zrem(self.INDEX_KEY, session_id)
+            deleted, _ = await pipe.execute()
+
+        return bool(deleted)
+
+    async def list_ids(self) -> List[str]:
+        """List the ids of all active sessions"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            # Drop sessions whose hash has expired since they were indexed
+            pipe.zremrangebyscore(self.INDEX_KEY, "-inf", time.time())
+            pipe.zrange(self.INDEX_KEY, 0, -1)
+            _, session_ids = await pipe.execute()
+
+        return session_ids